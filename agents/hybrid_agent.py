@@ -1,27 +1,24 @@
 """Hybrid Agent that combines RAG and Web Search capabilities."""
 
 import os
-from typing import Dict, Any
-from langchain_openai import ChatOpenAI
+import re
+import difflib
+from datetime import datetime
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
 from langchain_core.prompts import ChatPromptTemplate
 
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import OPENAI_API_KEY, LLM_MODEL
-from agents.rag_agent import query_rag
-from agents.web_search_agent import search_web
+from agents.rag_agent import query_rag, stream_rag
+from agents.web_search_agent import search_web, stream_web
 from utils.vector_store import get_document_count
+from utils.llm import get_llm, generate
+from utils.semantic_cache import semantic_cached
 
 
-HYBRID_PROMPT_TEMPLATE = """You are a helpful AI assistant that answers questions using both document knowledge and web search results.
-
-Document Context (from uploaded documents):
-{rag_context}
-
-Web Search Results:
-{web_context}
-
-User Question: {question}
+HYBRID_SYSTEM_PROMPT = """You are a helpful AI assistant that answers questions using both document knowledge and web search results.
 
 Instructions:
 1. Synthesize information from BOTH the documents and web search results
@@ -29,7 +26,15 @@ Instructions:
 3. Use web search results for broader context or recent information
 4. Clearly indicate when information comes from documents vs. the web
 5. If there are conflicts between sources, acknowledge them
-6. Be comprehensive but concise
+6. Be comprehensive but concise"""
+
+HYBRID_PROMPT_TEMPLATE = """Document Context (from uploaded documents):
+{rag_context}
+
+Web Search Results:
+{web_context}
+
+User Question: {question}
 
 Answer:"""
 
@@ -49,44 +54,83 @@ Determine if this question is best answered by:
 
 Respond with just one word: documents, web, or hybrid"""
 
+HYBRID_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", HYBRID_SYSTEM_PROMPT),
+    ("human", HYBRID_PROMPT_TEMPLATE)
+])
+ROUTER_PROMPT = ChatPromptTemplate.from_template(QUERY_ROUTER_PROMPT)
 
-def get_llm() -> ChatOpenAI:
-    """Get the ChatOpenAI LLM instance."""
-    if not OPENAI_API_KEY:
-        raise ValueError("OPENAI_API_KEY is not set. Please set it in your .env file.")
-    
-    return ChatOpenAI(
-        model=LLM_MODEL,
-        openai_api_key=OPENAI_API_KEY,
-        temperature=0.7
-    )
 
+# Phrases that signal the question needs fresh information from the web
+WEB_HINT_PATTERN = re.compile(r"\b(today|latest|news)\b", re.IGNORECASE)
+YEAR_PATTERN = re.compile(r"\b(19|20)\d{2}\b")
 
-def route_query(question: str) -> str:
+# Words that tie a question to the uploaded documents
+DOCUMENT_HINT_PATTERN = re.compile(
+    r"\b(documents?|files?|uploaded|pdfs?|sections?|chapters?|pages?)\b",
+    re.IGNORECASE
+)
+
+# Questions at most this many words that name a document go straight to RAG
+MAX_DOCUMENT_LOOKUP_WORDS = 15
+
+# Answers at least this similar are treated as the same and not re-synthesized
+ANSWER_SIMILARITY_THRESHOLD = 0.9
+
+
+def _heuristic_route(question: str, sources: Tuple[str, ...]) -> Optional[str]:
     """
-    Route a query to the appropriate agent(s).
+    Route obvious questions without an LLM call, or return None.
     
-    Returns:
-        'documents', 'web', or 'hybrid'
+    Questions with both document and web signals are left to the LLM router.
     """
-    from utils.vector_store import get_all_sources
+    lowered = question.lower()
     
-    doc_count = get_document_count()
-    has_documents = doc_count > 0
-    sources = get_all_sources() if has_documents else []
+    # Short lookups that name an uploaded document
+    names_document = False
+    if len(question.split()) <= MAX_DOCUMENT_LOOKUP_WORDS:
+        for source in sources:
+            stem = os.path.splitext(source)[0].lower()
+            if source.lower() in lowered or (
+                len(stem) >= 3 and re.search(r"\b" + re.escape(stem) + r"\b", lowered)
+            ):
+                names_document = True
+                break
     
-    # If no documents, use web search
-    if not has_documents:
+    # Recency words or a year still to come
+    current_year = datetime.now().year
+    wants_web = bool(WEB_HINT_PATTERN.search(question)) or any(
+        int(match.group(0)) > current_year for match in YEAR_PATTERN.finditer(question)
+    )
+    
+    if names_document and not wants_web:
+        return "documents"
+    if wants_web and not names_document and not DOCUMENT_HINT_PATTERN.search(question):
         return "web"
     
-    # Use LLM to route
-    prompt = ChatPromptTemplate.from_template(QUERY_ROUTER_PROMPT)
-    llm = get_llm()
-    chain = prompt | llm
+    return None
+
+
+@lru_cache(maxsize=1)
+def get_hybrid_chain():
+    """Get the hybrid synthesis prompt piped into the shared LLM."""
+    return HYBRID_PROMPT | get_llm()
+
+
+@lru_cache(maxsize=1)
+def get_router_chain():
+    """Get the query router prompt piped into the shared LLM."""
+    return ROUTER_PROMPT | get_llm()
+
+
+@lru_cache(maxsize=512)
+def _route_query_cached(question: str, doc_count: int, sources: Tuple[str, ...]) -> str:
+    """Classify a question with the LLM router; cached per document state."""
+    chain = get_router_chain()
     
     response = chain.invoke({
         "question": question,
-        "has_documents": "Yes" if has_documents else "No",
+        "has_documents": "Yes" if doc_count > 0 else "No",
         "document_sources": ", ".join(sources) if sources else "None"
     })
     
@@ -100,81 +144,186 @@ def route_query(question: str) -> str:
         return "hybrid"
 
 
-def query_hybrid(question: str, auto_route: bool = True) -> Dict[str, Any]:
+def route_query(question: str) -> str:
     """
-    Query using both RAG and Web Search, combining the results.
-    
-    Args:
-        question: The user's question
-        auto_route: If True, automatically determine the best approach
+    Route a query to the appropriate agent(s).
     
     Returns:
-        Dict containing 'answer', 'sources', 'mode', and context info
+        'documents', 'web', or 'hybrid'
     """
+    from utils.vector_store import get_all_sources
+    
+    doc_count = get_document_count()
+    has_documents = doc_count > 0
+    
+    # If no documents, use web search
+    if not has_documents:
+        return "web"
+    
+    sources = tuple(sorted(get_all_sources()))
+    
+    # Skip the LLM for questions the heuristics can settle
+    route = _heuristic_route(question, sources)
+    if route is not None:
+        return route
+    
+    # Use LLM to route
+    return _route_query_cached(question, doc_count, sources)
+
+
+def _answers_match(first: str, second: str) -> bool:
+    """Check whether two answers are near-identical."""
+    matcher = difflib.SequenceMatcher(None, first, second)
+    # Try the cheap upper bounds before the full comparison
+    return (
+        matcher.real_quick_ratio() > ANSWER_SIMILARITY_THRESHOLD
+        and matcher.quick_ratio() > ANSWER_SIMILARITY_THRESHOLD
+        and matcher.ratio() > ANSWER_SIMILARITY_THRESHOLD
+    )
+
+
+def _combine_sources(rag_result: Dict[str, Any], web_result: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Merge document and web sources into one tagged list."""
+    all_sources = []
+    
+    # Add document sources
+    for source in rag_result.get("sources", []):
+        all_sources.append({"type": "document", "name": source})
+    
+    # Add web sources
+    for source in web_result.get("sources", []):
+        all_sources.append({
+            "type": "web",
+            "title": source.get("title", ""),
+            "url": source.get("url", "")
+        })
+    
+    return all_sources
+
+
+def _run_hybrid(question: str, auto_route: bool, stream: bool) -> Dict[str, Any]:
+    """Route a question and combine RAG and web search results as needed."""
     doc_count = get_document_count()
     
     if auto_route:
         route = route_query(question)
         
         if route == "documents":
-            result = query_rag(question)
+            result = stream_rag(question) if stream else query_rag(question)
             result["mode"] = "documents"
             return result
         elif route == "web":
-            result = search_web(question)
+            result = stream_web(question) if stream else search_web(question)
             result["mode"] = "web"
             return result
     
     # Hybrid mode: combine both
     rag_result = {"answer": "", "sources": [], "context": ""}
     web_result = {"answer": "", "sources": [], "raw_results": {}}
+    # Failures are tracked apart from empty results
+    rag_error = None
+    web_error = None
     
-    # Get RAG results if documents available
-    if doc_count > 0:
+    # Run document retrieval and web search concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        rag_future = executor.submit(query_rag, question) if doc_count > 0 else None
+        web_future = executor.submit(search_web, question)
+        
+        # Get RAG results if documents available
+        if rag_future is not None:
+            try:
+                rag_result = rag_future.result()
+            except Exception as e:
+                rag_error = f"Error retrieving from documents: {str(e)}"
+                rag_result["context"] = rag_error
+        
+        # Get web search results
         try:
-            rag_result = query_rag(question)
+            web_result = web_future.result()
         except Exception as e:
-            rag_result["context"] = f"Error retrieving from documents: {str(e)}"
+            web_error = f"Error searching web: {str(e)}"
+            web_result["answer"] = web_error
     
-    # Get web search results
-    try:
-        web_result = search_web(question)
-    except Exception as e:
-        web_result["answer"] = f"Error searching web: {str(e)}"
+    # A failed side makes the result partial, so it is not cached
+    partial = rag_error is not None or web_error is not None
+    rag_empty = not rag_result.get("sources")
+    web_empty = not web_result.get("sources")
+    
+    # Nothing to synthesize when neither side found anything
+    if rag_empty and web_empty:
+        errors = [error for error in (rag_error, web_error) if error]
+        return {
+            "answer": "\n\n".join(errors) or "I couldn't find relevant information in the uploaded documents or on the web.",
+            "sources": [],
+            "mode": "hybrid",
+            "rag_context": rag_result.get("context", ""),
+            "web_results": web_result.get("raw_results", {}),
+            "partial": partial
+        }
+    
+    # Skip synthesis when only one side found anything, unless the other
+    # side failed; synthesis then reports the failure alongside the answer
+    if not partial:
+        if rag_empty:
+            web_result["mode"] = "web"
+            return web_result
+        if web_empty:
+            rag_result["mode"] = "documents"
+            return rag_result
     
-    # Combine using LLM
     rag_context = rag_result.get("context", "No document context available.")
     web_context = web_result.get("answer", "No web search results available.")
+    all_sources = _combine_sources(rag_result, web_result)
     
-    prompt = ChatPromptTemplate.from_template(HYBRID_PROMPT_TEMPLATE)
-    llm = get_llm()
-    chain = prompt | llm
+    # Skip synthesis when both sides already agree
+    if not partial and _answers_match(rag_result.get("answer", ""), web_context):
+        return {
+            "answer": rag_result["answer"],
+            "sources": all_sources,
+            "mode": "hybrid",
+            "rag_context": rag_context,
+            "web_results": web_result.get("raw_results", {}),
+            "partial": partial
+        }
     
-    response = chain.invoke({
+    # Combine using LLM
+    answer = generate(get_hybrid_chain(), {
         "rag_context": rag_context,
         "web_context": web_context,
         "question": question
-    })
-    
-    # Combine sources
-    all_sources = []
-    
-    # Add document sources
-    for source in rag_result.get("sources", []):
-        all_sources.append({"type": "document", "name": source})
-    
-    # Add web sources
-    for source in web_result.get("sources", []):
-        all_sources.append({
-            "type": "web",
-            "title": source.get("title", ""),
-            "url": source.get("url", "")
-        })
+    }, stream=stream)
     
     return {
-        "answer": response.content,
+        "answer": answer,
         "sources": all_sources,
         "mode": "hybrid",
         "rag_context": rag_context,
-        "web_results": web_result.get("raw_results", {})
+        "web_results": web_result.get("raw_results", {}),
+        "partial": partial
     }
+
+
+@semantic_cached(mode="hybrid")
+def query_hybrid(question: str, auto_route: bool = True) -> Dict[str, Any]:
+    """
+    Query using both RAG and Web Search, combining the results.
+    
+    Args:
+        question: The user's question
+        auto_route: If True, automatically determine the best approach
+    
+    Returns:
+        Dict containing 'answer', 'sources', 'mode', and context info
+    """
+    return _run_hybrid(question, auto_route, stream=False)
+
+
+@semantic_cached(mode="hybrid")
+def stream_hybrid(question: str, auto_route: bool = True) -> Dict[str, Any]:
+    """
+    Query using both RAG and Web Search, streaming the final answer.
+    
+    Returns:
+        Same as query_hybrid, except a generated 'answer' may be an iterator of text chunks
+    """
+    return _run_hybrid(question, auto_route, stream=True)
@@ -1,43 +1,44 @@
 """RAG Agent for document-based question answering."""
 
 import os
+from functools import lru_cache
 from typing import List, Dict, Any
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.documents import Document
 
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import OPENAI_API_KEY, LLM_MODEL, TOP_K_RESULTS
+from config import TOP_K_RESULTS
 from utils.vector_store import similarity_search, get_document_count
+from utils.llm import get_llm, generate
+from utils.semantic_cache import semantic_cached
 
 
-RAG_PROMPT_TEMPLATE = """You are a helpful AI assistant that answers questions based on the provided context from documents.
-
-Context from documents:
-{context}
-
-User Question: {question}
+RAG_SYSTEM_PROMPT = """You are a helpful AI assistant that answers questions based on the provided context from documents.
 
 Instructions:
 1. Answer the question based ONLY on the provided context
 2. If the context doesn't contain enough information to answer, say so clearly
 3. Cite which document/source the information comes from when relevant
-4. Be concise but thorough
+4. Be concise but thorough"""
+
+RAG_PROMPT_TEMPLATE = """Context from documents:
+{context}
+
+User Question: {question}
 
 Answer:"""
 
+RAG_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", RAG_SYSTEM_PROMPT),
+    ("human", RAG_PROMPT_TEMPLATE)
+])
 
-def get_llm() -> ChatOpenAI:
-    """Get the ChatOpenAI LLM instance."""
-    if not OPENAI_API_KEY:
-        raise ValueError("OPENAI_API_KEY is not set. Please set it in your .env file.")
-    
-    return ChatOpenAI(
-        model=LLM_MODEL,
-        openai_api_key=OPENAI_API_KEY,
-        temperature=0.7
-    )
+
+@lru_cache(maxsize=1)
+def get_rag_chain():
+    """Get the RAG prompt piped into the shared LLM."""
+    return RAG_PROMPT | get_llm()
 
 
 def format_context(documents: List[Document]) -> str:
@@ -49,13 +50,8 @@ def format_context(documents: List[Document]) -> str:
     return "\n".join(context_parts)
 
 
-def query_rag(question: str, k: int = TOP_K_RESULTS) -> Dict[str, Any]:
-    """
-    Query the RAG system with a question.
-    
-    Returns:
-        Dict containing 'answer', 'sources', and 'context'
-    """
+def _run_rag(question: str, k: int, stream: bool) -> Dict[str, Any]:
+    """Retrieve context for a question and generate the answer."""
     # Check if we have any documents
     doc_count = get_document_count()
     if doc_count == 0:
@@ -78,26 +74,42 @@ def query_rag(question: str, k: int = TOP_K_RESULTS) -> Dict[str, Any]:
     # Format context
     context = format_context(retrieved_docs)
     
-    # Create prompt
-    prompt = ChatPromptTemplate.from_template(RAG_PROMPT_TEMPLATE)
-    
-    # Get LLM and generate response
-    llm = get_llm()
-    chain = prompt | llm
-    
-    response = chain.invoke({
+    # Generate response
+    answer = generate(get_rag_chain(), {
         "context": context,
         "question": question
-    })
+    }, stream=stream)
     
-    # Extract sources
-    sources = list(set(
+    # Extract sources, keeping retrieval order
+    sources = list(dict.fromkeys(
         doc.metadata.get("source", "Unknown") 
         for doc in retrieved_docs
     ))
     
     return {
-        "answer": response.content,
+        "answer": answer,
         "sources": sources,
         "context": context
     }
+
+
+@semantic_cached(mode="documents")
+def query_rag(question: str, k: int = TOP_K_RESULTS) -> Dict[str, Any]:
+    """
+    Query the RAG system with a question.
+    
+    Returns:
+        Dict containing 'answer', 'sources', and 'context'
+    """
+    return _run_rag(question, k, stream=False)
+
+
+@semantic_cached(mode="documents")
+def stream_rag(question: str, k: int = TOP_K_RESULTS) -> Dict[str, Any]:
+    """
+    Query the RAG system, streaming the generated answer.
+    
+    Returns:
+        Same as query_rag, except a generated 'answer' is an iterator of text chunks
+    """
+    return _run_rag(question, k, stream=True)
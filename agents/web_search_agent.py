@@ -2,41 +2,70 @@
 
 import os
 import requests
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import List, Dict, Any
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import SERPER_API_KEY, SERPER_API_URL, MAX_SEARCH_RESULTS, OPENAI_API_KEY, LLM_MODEL
+from config import (
+    SERPER_API_KEY,
+    SERPER_API_URL,
+    MAX_SEARCH_RESULTS,
+    SERPER_TIMEOUT,
+    SERPER_MAX_RETRIES,
+)
+from utils.llm import get_llm, generate
+from utils.semantic_cache import semantic_cached
 
 
-WEB_SEARCH_PROMPT_TEMPLATE = """You are a helpful AI assistant that answers questions based on web search results.
-
-Web Search Results:
-{search_results}
-
-User Question: {question}
+WEB_SEARCH_SYSTEM_PROMPT = """You are a helpful AI assistant that answers questions based on web search results.
 
 Instructions:
 1. Synthesize the information from the search results to answer the question
 2. Cite sources by mentioning the website names when relevant
 3. If the search results don't contain enough information, acknowledge the limitations
-4. Provide a comprehensive but concise answer
+4. Provide a comprehensive but concise answer"""
+
+WEB_SEARCH_PROMPT_TEMPLATE = """Web Search Results:
+{search_results}
+
+User Question: {question}
 
 Answer:"""
 
+WEB_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", WEB_SEARCH_SYSTEM_PROMPT),
+    ("human", WEB_SEARCH_PROMPT_TEMPLATE)
+])
 
-def get_llm() -> ChatOpenAI:
-    """Get the ChatOpenAI LLM instance."""
-    if not OPENAI_API_KEY:
-        raise ValueError("OPENAI_API_KEY is not set. Please set it in your .env file.")
-    
-    return ChatOpenAI(
-        model=LLM_MODEL,
-        openai_api_key=OPENAI_API_KEY,
-        temperature=0.7
+
+@lru_cache(maxsize=1)
+def get_web_chain():
+    """Get the web search prompt piped into the shared LLM."""
+    return WEB_PROMPT | get_llm()
+
+
+@lru_cache(maxsize=1)
+def get_serper_session() -> requests.Session:
+    """Get a pooled HTTP session for Serper that keeps connections alive."""
+    retry = Retry(
+        total=SERPER_MAX_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=frozenset(["POST"]),
+        raise_on_status=False
     )
+    
+    session = requests.Session()
+    session.headers.update({
+        "X-API-KEY": SERPER_API_KEY,
+        "Content-Type": "application/json"
+    })
+    session.mount("https://", HTTPAdapter(max_retries=retry))
+    return session
 
 
 def search_serper(query: str, num_results: int = MAX_SEARCH_RESULTS) -> Dict[str, Any]:
@@ -49,18 +78,13 @@ def search_serper(query: str, num_results: int = MAX_SEARCH_RESULTS) -> Dict[str
     if not SERPER_API_KEY:
         raise ValueError("SERPER_API_KEY is not set. Please set it in your .env file.")
     
-    headers = {
-        "X-API-KEY": SERPER_API_KEY,
-        "Content-Type": "application/json"
-    }
-    
     payload = {
         "q": query,
         "num": num_results
     }
     
     try:
-        response = requests.post(SERPER_API_URL, headers=headers, json=payload)
+        response = get_serper_session().post(SERPER_API_URL, json=payload, timeout=SERPER_TIMEOUT)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -69,32 +93,34 @@ def search_serper(query: str, num_results: int = MAX_SEARCH_RESULTS) -> Dict[str
 
 def format_search_results(results: Dict[str, Any]) -> str:
     """Format Serper API results into a readable string."""
+    header_parts = []
     formatted_parts = []
     
-    # Process organic results
-    organic = results.get("organic", [])
-    for i, result in enumerate(organic, 1):
-        title = result.get("title", "No title")
-        snippet = result.get("snippet", "No description")
-        link = result.get("link", "")
-        formatted_parts.append(f"[Result {i}]\nTitle: {title}\nSnippet: {snippet}\nURL: {link}\n")
+    # Process knowledge graph if present
+    knowledge_graph = results.get("knowledgeGraph")
+    if knowledge_graph:
+        title = knowledge_graph.get("title", "")
+        description = knowledge_graph.get("description", "")
+        if title or description:
+            header_parts.append(f"[Knowledge Graph]\nTitle: {title}\nDescription: {description}\n")
     
     # Process answer box if present
     answer_box = results.get("answerBox")
     if answer_box:
         answer = answer_box.get("answer") or answer_box.get("snippet", "")
         if answer:
-            formatted_parts.insert(0, f"[Featured Answer]\n{answer}\n")
+            header_parts.append(f"[Featured Answer]\n{answer}\n")
     
-    # Process knowledge graph if present
-    knowledge_graph = results.get("knowledgeGraph")
-    if knowledge_graph:
-        title = knowledge_graph.get("title", "")
-        description = knowledge_graph.get("description", "")
-        if title or description:
-            formatted_parts.insert(0, f"[Knowledge Graph]\nTitle: {title}\nDescription: {description}\n")
+    # Process organic results
+    organic = results.get("organic", [])
+    for i, result in enumerate(organic, 1):
+        title = result.get("title", "No title")
+        snippet = result.get("snippet", "No description")
+        link = result.get("link", "")
+        formatted_parts.append(f"[Result {i}]\nTitle: {title}\nSnippet: {snippet}\nURL: {link}\n")
     
-    return "\n".join(formatted_parts) if formatted_parts else "No search results found."
+    all_parts = header_parts + formatted_parts
+    return "\n".join(all_parts) if all_parts else "No search results found."
 
 
 def extract_sources(results: Dict[str, Any]) -> List[Dict[str, str]]:
@@ -111,13 +137,8 @@ def extract_sources(results: Dict[str, Any]) -> List[Dict[str, str]]:
     return sources
 
 
-def search_web(question: str) -> Dict[str, Any]:
-    """
-    Perform a web search and generate an answer.
-    
-    Returns:
-        Dict containing 'answer', 'sources', and 'raw_results'
-    """
+def _run_web(question: str, stream: bool) -> Dict[str, Any]:
+    """Search the web for a question and generate the answer."""
     # Perform search
     search_results = search_serper(question)
     
@@ -131,23 +152,39 @@ def search_web(question: str) -> Dict[str, Any]:
             "raw_results": search_results
         }
     
-    # Create prompt
-    prompt = ChatPromptTemplate.from_template(WEB_SEARCH_PROMPT_TEMPLATE)
-    
-    # Get LLM and generate response
-    llm = get_llm()
-    chain = prompt | llm
-    
-    response = chain.invoke({
+    # Generate response
+    answer = generate(get_web_chain(), {
         "search_results": formatted_results,
         "question": question
-    })
+    }, stream=stream)
     
     # Extract sources
     sources = extract_sources(search_results)
     
     return {
-        "answer": response.content,
+        "answer": answer,
         "sources": sources,
         "raw_results": search_results
     }
+
+
+@semantic_cached(mode="web")
+def search_web(question: str) -> Dict[str, Any]:
+    """
+    Perform a web search and generate an answer.
+    
+    Returns:
+        Dict containing 'answer', 'sources', and 'raw_results'
+    """
+    return _run_web(question, stream=False)
+
+
+@semantic_cached(mode="web")
+def stream_web(question: str) -> Dict[str, Any]:
+    """
+    Perform a web search, streaming the generated answer.
+    
+    Returns:
+        Same as search_web, except a generated 'answer' is an iterator of text chunks
+    """
+    return _run_web(question, stream=True)
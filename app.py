@@ -2,6 +2,7 @@
 import streamlit as st
 import os
 import sys
+import itertools
 
 # Add project root to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -26,11 +27,18 @@ def get_vector_store_functions():
     )
     return add_documents, get_document_count, get_all_sources, delete_documents_by_source, clear_all_documents
 
+@st.cache_resource(show_spinner=False)
+def warm_up_vector_store():
+    """Load the vector index once per process rather than on the first query."""
+    from utils.vector_store import warm_up
+    warm_up()
+    return True
+
 def get_agents():
-    from agents.rag_agent import query_rag
-    from agents.web_search_agent import search_web
-    from agents.hybrid_agent import query_hybrid
-    return query_rag, search_web, query_hybrid
+    from agents.rag_agent import stream_rag
+    from agents.web_search_agent import stream_web
+    from agents.hybrid_agent import stream_hybrid
+    return stream_rag, stream_web, stream_hybrid
 
 # Page configuration
 st.set_page_config(
@@ -191,13 +199,31 @@ def render_sidebar():
                     # Lazy import
                     process_uploaded_file = get_document_processor()
                     add_documents, _, _, _, _ = get_vector_store_functions()
+                    
+                    # Load every file first, then stream all chunks into one ingestion pass
+                    chunk_iterators = []
+                    processed_files = []
                     for uploaded_file in uploaded_files:
                         try:
                             documents = process_uploaded_file(uploaded_file)
-                            add_documents(documents)
-                            st.success(f"✅ Processed: {uploaded_file.name}")
+                            if documents is None:
+                                st.info(f"ℹ️ Already indexed: {uploaded_file.name}")
+                                continue
+                            chunk_iterators.append(documents)
+                            processed_files.append(uploaded_file.name)
                         except Exception as e:
                             st.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
+                    
+                    if chunk_iterators:
+                        try:
+                            failures = add_documents(itertools.chain.from_iterable(chunk_iterators))
+                            for file_name in processed_files:
+                                if file_name in failures:
+                                    st.error(f"❌ Error processing {file_name}: {str(failures[file_name])}")
+                                else:
+                                    st.success(f"✅ Processed: {file_name}")
+                        except Exception as e:
+                            st.error(f"❌ Error indexing documents: {str(e)}")
         
         st.markdown("---")
         
@@ -289,14 +315,14 @@ def render_chat_interface():
                     mode = st.session_state.mode
                     
                     # Lazy import agents
-                    query_rag, search_web, query_hybrid = get_agents()
+                    stream_rag, stream_web, stream_hybrid = get_agents()
                     
                     if mode == "rag":
-                        result = query_rag(prompt)
+                        result = stream_rag(prompt)
                     elif mode == "web":
-                        result = search_web(prompt)
+                        result = stream_web(prompt)
                     else:  # hybrid
-                        result = query_hybrid(prompt, auto_route=True)
+                        result = stream_hybrid(prompt, auto_route=True)
                     
                     answer = result.get("answer", "I couldn't generate a response.")
                     sources = result.get("sources", [])
@@ -307,7 +333,18 @@ def render_chat_interface():
                     mode_icon = mode_icons.get(used_mode, "🤖")
                     
                     st.markdown(f"*{mode_icon} Mode: {used_mode.title()}*")
-                    st.markdown(answer)
+                    
+                    if isinstance(answer, str):
+                        # Cached or canned answers arrive complete
+                        st.markdown(answer)
+                    else:
+                        # Render tokens as they stream in
+                        placeholder = st.empty()
+                        answer_parts = []
+                        for chunk in answer:
+                            answer_parts.append(chunk)
+                            placeholder.markdown("".join(answer_parts))
+                        answer = "".join(answer_parts)
                     
                     # Display sources
                     if sources:
@@ -342,6 +379,7 @@ def render_chat_interface():
 def main():
     """Main application entry point."""
     initialize_session_state()
+    warm_up_vector_store()
     render_sidebar()
     render_chat_interface()
 
@@ -12,19 +12,44 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
 # Model Configuration
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_BATCH_SIZE = 512
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
 
-# Document Processing
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
+# Embedding Cache
+EMBEDDING_CACHE_PATH = "data/emb_cache.sqlite3"
+EMBEDDING_CACHE_MEMORY_SIZE = 1024
+
+# Document Processing (chunk sizes are measured in embedding-model tokens)
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 150
+PDF_PARALLEL_MIN_PAGES = 32
+PDF_MAX_WORKERS = os.cpu_count() or 1
 
 # Vector Store
 CHROMA_PERSIST_DIRECTORY = "data/chroma_db"
 COLLECTION_NAME = "documents"
+INGEST_BATCH_SIZE = 128  # chunks per vector store insert; 50-250 balances commit overhead and memory
+METADATA_DB_PATH = os.path.join(CHROMA_PERSIST_DIRECTORY, "metadata.sqlite3")  # lives and dies with the Chroma data
+METADATA_SCAN_PAGE_SIZE = 10000
 
 # Serper API
 SERPER_API_URL = "https://google.serper.dev/search"
 MAX_SEARCH_RESULTS = 5
+SERPER_TIMEOUT = 10
+SERPER_MAX_RETRIES = 3
 
 # RAG Settings
 TOP_K_RESULTS = 4
+
+# HNSW index parameters (only applied when the collection is created)
+HNSW_SPACE = "cosine"
+HNSW_CONSTRUCTION_EF = 200
+HNSW_M = 32
+HNSW_SEARCH_EF = max(100, TOP_K_RESULTS * 4)  # never below chromadb's default of 100
+
+# Semantic Response Cache
+SEMANTIC_CACHE_PATH = "data/semantic_cache.pkl"
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_MAX_ENTRIES = 1000
+SEMANTIC_CACHE_TTL_SECONDS = 24 * 60 * 60
+SEMANTIC_CACHE_WEB_TTL_SECONDS = 15 * 60  # answers using web results go stale quickly
@@ -1,13 +1,28 @@
 """Document processing utilities for loading and chunking documents."""
 
+import io
 import os
-from typing import List, Dict, Any
+import hashlib
+import math
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
 
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import CHUNK_SIZE, CHUNK_OVERLAP
+from config import (
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    PDF_PARALLEL_MIN_PAGES,
+    PDF_MAX_WORKERS,
+    EMBEDDING_MODEL,
+)
+
+
+# A chunk of text and its metadata; Documents are only built at insertion time
+Chunk = Tuple[str, Dict[str, Any]]
 
 
 def load_text_file(file_path: str) -> str:
@@ -16,15 +31,49 @@ def load_text_file(file_path: str) -> str:
         return f.read()
 
 
-def load_pdf_file(file_path: str) -> str:
-    """Load content from a PDF file."""
+def _extract_page_range(data: bytes, start: int, stop: int) -> List[str]:
+    """Extract text from a range of PDF pages in a worker process."""
+    from pypdf import PdfReader
+    
+    reader = PdfReader(io.BytesIO(data))
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def extract_pdf_text(data: bytes) -> str:
+    """
+    Extract text from PDF bytes.
+    
+    Large PDFs are split into page ranges that are extracted in parallel
+    worker processes, since pypdf parsing is CPU-bound pure Python.
+    """
     from pypdf import PdfReader
     
-    reader = PdfReader(file_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
-    return text
+    reader = PdfReader(io.BytesIO(data))
+    num_pages = len(reader.pages)
+    workers = min(PDF_MAX_WORKERS, num_pages)
+    
+    if num_pages < PDF_PARALLEL_MIN_PAGES or workers < 2:
+        page_texts = [page.extract_text() or "" for page in reader.pages]
+    else:
+        step = math.ceil(num_pages / workers)
+        ranges = [(start, min(start + step, num_pages)) for start in range(0, num_pages, step)]
+        
+        # Spawn rather than fork: forking Streamlit's multi-threaded server
+        # can copy a held lock into the child and deadlock it
+        with ProcessPoolExecutor(
+            max_workers=len(ranges),
+            mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = [executor.submit(_extract_page_range, data, start, stop) for start, stop in ranges]
+            page_texts = [text for future in futures for text in future.result()]
+    
+    return "\n".join(page_texts)
+
+
+def load_pdf_file(file_path: str) -> str:
+    """Load content from a PDF file."""
+    with open(file_path, 'rb') as f:
+        return extract_pdf_text(f.read())
 
 
 def load_document(file_path: str) -> str:
@@ -39,56 +88,101 @@ def load_document(file_path: str) -> str:
         raise ValueError(f"Unsupported file type: {ext}")
 
 
-def load_uploaded_file(uploaded_file) -> str:
-    """Load content from a Streamlit uploaded file."""
-    file_name = uploaded_file.name
+def load_file_bytes(file_name: str, data: bytes) -> str:
+    """Load content from raw file bytes based on the file name's extension."""
     ext = os.path.splitext(file_name)[1].lower()
     
     if ext == '.pdf':
-        from pypdf import PdfReader
-        import io
-        
-        reader = PdfReader(io.BytesIO(uploaded_file.read()))
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        return extract_pdf_text(data)
     elif ext in ['.txt', '.md']:
-        return uploaded_file.read().decode('utf-8')
+        return data.decode('utf-8')
     else:
         raise ValueError(f"Unsupported file type: {ext}")
 
 
-def chunk_text(
+def load_uploaded_file(uploaded_file) -> str:
+    """Load content from a Streamlit uploaded file."""
+    return load_file_bytes(uploaded_file.name, uploaded_file.read())
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """Get the tiktoken encoding used by the embedding model, or None if unavailable."""
+    import tiktoken
+    
+    try:
+        try:
+            return tiktoken.encoding_for_model(EMBEDDING_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Encoding files could not be loaded (e.g. offline)
+        return None
+
+
+def token_length(text: str) -> int:
+    """Count embedding-model tokens in a text."""
+    encoding = _get_encoding()
+    if encoding is None:
+        # Roughly four characters per token for English text
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def iter_chunks(
     text: str,
     chunk_size: int = CHUNK_SIZE,
     chunk_overlap: int = CHUNK_OVERLAP,
     metadata: Dict[str, Any] = None
-) -> List[Document]:
-    """Split text into chunks for embedding."""
+) -> Iterator[Chunk]:
+    """Split text into chunks for embedding, yielding (text, metadata) pairs."""
+    # The splitter measures the same pieces repeatedly; memoize for this split only
+    lengths: Dict[str, int] = {}
+    
+    def cached_token_length(piece: str) -> int:
+        if piece not in lengths:
+            lengths[piece] = token_length(piece)
+        return lengths[piece]
+    
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
-        length_function=len,
+        length_function=cached_token_length,
         separators=["\n\n", "\n", " ", ""]
     )
     
     chunks = text_splitter.split_text(text)
+    # The full text and measured pieces are no longer needed once it has been split
+    del text
+    lengths.clear()
     
-    documents = []
     for i, chunk in enumerate(chunks):
         doc_metadata = metadata.copy() if metadata else {}
         doc_metadata["chunk_index"] = i
-        documents.append(Document(page_content=chunk, metadata=doc_metadata))
-    
-    return documents
+        yield chunk, doc_metadata
 
 
-def process_uploaded_file(uploaded_file) -> List[Document]:
-    """Process an uploaded file and return chunked documents."""
-    text = load_uploaded_file(uploaded_file)
+def process_uploaded_file(uploaded_file) -> Optional[Iterator[Chunk]]:
+    """
+    Process an uploaded file and return its (text, metadata) chunks.
+    
+    The file is loaded immediately so read errors surface here, while the
+    chunks are produced lazily as the returned iterator is consumed.
+    Returns None if a file with identical content is already indexed.
+    """
+    from utils.vector_store import has_file_hash
+    
+    data = uploaded_file.read()
+    file_hash = hashlib.sha256(data).hexdigest()
+    if has_file_hash(file_hash):
+        return None
+    
+    text = load_file_bytes(uploaded_file.name, data)
+    del data
+    
     metadata = {
         "source": uploaded_file.name,
-        "file_type": os.path.splitext(uploaded_file.name)[1].lower()
+        "file_type": os.path.splitext(uploaded_file.name)[1].lower(),
+        "file_hash": file_hash
     }
-    return chunk_text(text, metadata=metadata)
+    return iter_chunks(text, metadata=metadata)
@@ -1,16 +1,36 @@
 """Embedding utilities using OpenAI embeddings."""
 
 import os
-from typing import List
+import array
+import hashlib
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
 from langchain_openai import OpenAIEmbeddings
 
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import OPENAI_API_KEY, EMBEDDING_MODEL
+from config import (
+    OPENAI_API_KEY,
+    EMBEDDING_MODEL,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MEMORY_SIZE,
+)
 
 
+# Shared connection to the on-disk embedding cache
+_cache_connection: Optional[sqlite3.Connection] = None
+_cache_lock = threading.Lock()
+
+# Keys per lookup query (SQLite allows at least 999 bound parameters)
+_CACHE_LOOKUP_BATCH_SIZE = 900
+
+
+@lru_cache(maxsize=1)
 def get_embeddings_model() -> OpenAIEmbeddings:
-    """Get the OpenAI embeddings model."""
+    """Get the shared OpenAI embeddings model."""
     if not OPENAI_API_KEY:
         raise ValueError("OPENAI_API_KEY is not set. Please set it in your .env file.")
     
@@ -20,13 +40,107 @@ def get_embeddings_model() -> OpenAIEmbeddings:
     )
 
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    """Generate embeddings for a list of texts."""
+def _cache_key(model: str, text: str) -> str:
+    """Build the disk cache key for a (model, text) pair."""
+    return hashlib.sha256((model + "::" + text).encode("utf-8")).hexdigest()
+
+
+def _get_cache_connection() -> sqlite3.Connection:
+    """Get or create the SQLite connection backing the embedding cache."""
+    global _cache_connection
+    
+    if _cache_connection is None:
+        cache_dir = os.path.dirname(EMBEDDING_CACHE_PATH)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        
+        _cache_connection = sqlite3.connect(EMBEDDING_CACHE_PATH, check_same_thread=False)
+        _cache_connection.execute("PRAGMA journal_mode=WAL")
+        _cache_connection.execute("PRAGMA synchronous=NORMAL")
+        _cache_connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        _cache_connection.commit()
+    
+    return _cache_connection
+
+
+def _cache_get(keys: List[str]) -> Dict[str, List[float]]:
+    """Fetch cached embeddings for the given keys from disk."""
+    found = {}
+    with _cache_lock:
+        connection = _get_cache_connection()
+        # One query per slice, kept under SQLite's bound-parameter limit
+        for start in range(0, len(keys), _CACHE_LOOKUP_BATCH_SIZE):
+            batch = keys[start:start + _CACHE_LOOKUP_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            rows = connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, vector in rows:
+                found[key] = array.array("d", vector).tolist()
+    return found
+
+
+def _cache_put(items: List[Tuple[str, List[float]]]) -> None:
+    """Store embeddings on disk."""
+    if not items:
+        return
+    
+    with _cache_lock:
+        connection = _get_cache_connection()
+        connection.executemany(
+            "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+            [(key, array.array("d", vector).tobytes()) for key, vector in items]
+        )
+        connection.commit()
+
+
+@lru_cache(maxsize=EMBEDDING_CACHE_MEMORY_SIZE)
+def _embed_query_cached(model: str, text: str) -> Tuple[float, ...]:
+    """Embed a query, checking the disk cache before calling the API."""
+    key = _cache_key(model, text)
+    
+    cached = _cache_get([key])
+    if key in cached:
+        return tuple(cached[key])
+    
     embeddings_model = get_embeddings_model()
-    return embeddings_model.embed_documents(texts)
+    vector = embeddings_model.embed_query(text)
+    _cache_put([(key, vector)])
+    return tuple(vector)
+
+
+def embed_texts(texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> List[List[float]]:
+    """
+    Generate embeddings for a list of texts, only embedding cache misses.
+    
+    Misses are sent to the API in slices of `batch_size` to stay within
+    the per-request input limits.
+    """
+    keys = [_cache_key(EMBEDDING_MODEL, text) for text in texts]
+    cached = _cache_get(list(set(keys)))
+    
+    # Embed each distinct uncached text once
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+    
+    if missing:
+        embeddings_model = get_embeddings_model()
+        missing_keys = list(missing.keys())
+        missing_texts = list(missing.values())
+        
+        for start in range(0, len(missing_texts), batch_size):
+            vectors = embeddings_model.embed_documents(missing_texts[start:start + batch_size])
+            new_items = list(zip(missing_keys[start:start + batch_size], vectors))
+            _cache_put(new_items)
+            cached.update(new_items)
+    
+    return [cached[key] for key in keys]
 
 
 def embed_query(query: str) -> List[float]:
     """Generate embedding for a single query."""
-    embeddings_model = get_embeddings_model()
-    return embeddings_model.embed_query(query)
+    return list(_embed_query_cached(EMBEDDING_MODEL, query))
@@ -0,0 +1,35 @@
+"""Shared chat model client used by the agents."""
+
+import os
+from functools import lru_cache
+from typing import Any, Dict, Iterator, Union
+from langchain_openai import ChatOpenAI
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import OPENAI_API_KEY, LLM_MODEL
+
+
+@lru_cache(maxsize=1)
+def get_llm() -> ChatOpenAI:
+    """Get the shared ChatOpenAI LLM instance, reusing its connection pool."""
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY is not set. Please set it in your .env file.")
+    
+    return ChatOpenAI(
+        model=LLM_MODEL,
+        openai_api_key=OPENAI_API_KEY,
+        temperature=0.7
+    )
+
+
+def generate(chain, inputs: Dict[str, Any], stream: bool = False) -> Union[str, Iterator[str]]:
+    """
+    Run a prompt chain and return its text.
+    
+    With stream=True, return an iterator that yields text chunks as the
+    model produces them instead of waiting for the full response.
+    """
+    if stream:
+        return (chunk.content for chunk in chain.stream(inputs))
+    return chain.invoke(inputs).content
@@ -0,0 +1,153 @@
+"""SQLite sidecar indexing document metadata alongside the vector store."""
+
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import METADATA_DB_PATH
+
+
+# Shared connection to the sidecar database
+_connection: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Get or create the SQLite connection for the sidecar database."""
+    global _connection
+    
+    if _connection is None:
+        db_dir = os.path.dirname(METADATA_DB_PATH)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        
+        _connection = sqlite3.connect(METADATA_DB_PATH, check_same_thread=False)
+        # WAL lets reads proceed during writes and fsyncs only at checkpoints
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("PRAGMA synchronous=NORMAL")
+    
+    return _connection
+
+
+def initialize() -> bool:
+    """
+    Create the metadata table and its source index if needed.
+    
+    Returns:
+        True if the table has not been backfilled from the collection yet
+    """
+    with _lock:
+        connection = _get_connection()
+        # Superseded by the per-document table below
+        connection.execute("DROP TABLE IF EXISTS sources")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS meta (id TEXT PRIMARY KEY, source TEXT, metadata TEXT)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_source ON meta(source)")
+        connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        connection.commit()
+        
+        # user_version is only set once a backfill has run to completion
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        return version < 1
+
+
+def mark_backfilled() -> None:
+    """Record that the table holds every document in the collection."""
+    with _lock:
+        connection = _get_connection()
+        connection.execute("PRAGMA user_version = 1")
+        connection.commit()
+
+
+def get_version() -> str:
+    """Get the token identifying the current contents of the store."""
+    with _lock:
+        connection = _get_connection()
+        row = connection.execute("SELECT value FROM state WHERE key = 'version'").fetchone()
+        if row is not None:
+            return row[0]
+    
+    return bump_version()
+
+
+def bump_version() -> str:
+    """
+    Record that the store's contents changed and return the new version.
+    
+    Versions are random rather than counters, so a store rebuilt from
+    scratch never reuses a version an earlier store had.
+    """
+    version = uuid.uuid4().hex
+    with _lock:
+        connection = _get_connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO state (key, value) VALUES ('version', ?)", (version,)
+        )
+        connection.commit()
+    return version
+
+
+def add_records(records: Iterable[Tuple[str, Optional[Dict[str, Any]]]]) -> None:
+    """Record the metadata for each (document ID, metadata) pair."""
+    rows = [
+        (doc_id, (metadata or {}).get("source"), json.dumps(metadata or {}))
+        for doc_id, metadata in records
+    ]
+    if not rows:
+        return
+    
+    with _lock:
+        connection = _get_connection()
+        connection.executemany(
+            "INSERT OR REPLACE INTO meta (id, source, metadata) VALUES (?, ?, ?)",
+            rows
+        )
+        connection.commit()
+
+
+def get_ids_for_source(source: str) -> List[str]:
+    """Get the IDs of all documents with a specific source."""
+    with _lock:
+        connection = _get_connection()
+        rows = connection.execute("SELECT id FROM meta WHERE source = ?", (source,)).fetchall()
+    return [row[0] for row in rows]
+
+
+def remove_ids(ids: List[str]) -> None:
+    """Remove the records for specific document IDs."""
+    with _lock:
+        connection = _get_connection()
+        connection.executemany("DELETE FROM meta WHERE id = ?", [(doc_id,) for doc_id in ids])
+        connection.commit()
+
+
+def remove_source(source: str) -> None:
+    """Remove all records with a specific source."""
+    with _lock:
+        connection = _get_connection()
+        connection.execute("DELETE FROM meta WHERE source = ?", (source,))
+        connection.commit()
+
+
+def clear() -> None:
+    """Remove all records."""
+    with _lock:
+        connection = _get_connection()
+        connection.execute("DELETE FROM meta")
+        connection.commit()
+
+
+def list_sources() -> List[str]:
+    """Get all distinct sources."""
+    with _lock:
+        connection = _get_connection()
+        rows = connection.execute(
+            "SELECT DISTINCT source FROM meta WHERE source IS NOT NULL ORDER BY source"
+        ).fetchall()
+    return [row[0] for row in rows]
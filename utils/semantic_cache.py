@@ -0,0 +1,202 @@
+"""Semantic cache that reuses agent answers for near-duplicate questions."""
+
+import os
+import copy
+import time
+import pickle
+import inspect
+import threading
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import (
+    SEMANTIC_CACHE_PATH,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_TTL_SECONDS,
+    SEMANTIC_CACHE_WEB_TTL_SECONDS,
+)
+from utils.embeddings import embed_query
+from utils.vector_store import get_store_version
+
+
+# Cached entries, loaded lazily from disk
+_store: Optional[Dict[str, Any]] = None
+_store_lock = threading.Lock()
+
+
+def _empty_store() -> Dict[str, Any]:
+    """Create an empty cache store."""
+    return {
+        "embeddings": None,  # np.ndarray of shape [N, dim], rows normalized
+        "scopes": [],
+        "results": [],
+        "expires_at": [],
+    }
+
+
+def _load_store() -> Dict[str, Any]:
+    """Get the cache store, loading it from disk on first use."""
+    global _store
+    
+    if _store is None:
+        _store = _empty_store()
+        if os.path.exists(SEMANTIC_CACHE_PATH):
+            try:
+                with open(SEMANTIC_CACHE_PATH, "rb") as f:
+                    _store = pickle.load(f)
+            except Exception:
+                _store = _empty_store()
+            
+            # Discard caches written with a different layout
+            if not isinstance(_store, dict) or _store.keys() != _empty_store().keys():
+                _store = _empty_store()
+    
+    return _store
+
+
+def _save_store(store: Dict[str, Any]) -> None:
+    """Persist the cache store to disk atomically."""
+    cache_dir = os.path.dirname(SEMANTIC_CACHE_PATH)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    tmp_path = SEMANTIC_CACHE_PATH + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(store, f)
+    os.replace(tmp_path, SEMANTIC_CACHE_PATH)
+
+
+def _normalize(embedding: Any) -> np.ndarray:
+    """Convert an embedding to a unit-length float32 vector."""
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def make_scope(mode: str, *args, **kwargs) -> Tuple:
+    """
+    Build the cache scope for a call.
+    
+    Answers are only shared between calls with the same mode, arguments,
+    and store version, so any upload, deletion, or clear invalidates them.
+    """
+    return (mode, get_store_version(), args, tuple(sorted(kwargs.items())))
+
+
+def lookup(question: str, scope: Tuple) -> Optional[Dict[str, Any]]:
+    """Return a cached result for a similar question in the same scope."""
+    query = _normalize(embed_query(question))
+    now = time.time()
+    
+    with _store_lock:
+        store = _load_store()
+        if store["embeddings"] is None or store["embeddings"].shape[1] != query.shape[0]:
+            return None
+        
+        candidates = [
+            i for i, (entry_scope, expires_at) in enumerate(zip(store["scopes"], store["expires_at"]))
+            if entry_scope == scope and now < expires_at
+        ]
+        if not candidates:
+            return None
+        
+        sims = store["embeddings"][candidates] @ query
+        best = int(np.argmax(sims))
+        if sims[best] < SEMANTIC_CACHE_THRESHOLD:
+            return None
+        
+        return copy.deepcopy(store["results"][candidates[best]])
+
+
+def _ttl_for(mode: str) -> int:
+    """Get how long a result in this mode stays valid, in seconds."""
+    if mode in ("web", "hybrid"):
+        return SEMANTIC_CACHE_WEB_TTL_SECONDS
+    return SEMANTIC_CACHE_TTL_SECONDS
+
+
+def insert(question: str, scope: Tuple, result: Dict[str, Any]) -> None:
+    """Store a result for a question in the given scope."""
+    vector = _normalize(embed_query(question))
+    # Routed hybrid results report the mode that actually answered
+    expires_at = time.time() + _ttl_for(result.get("mode", scope[0]))
+    
+    with _store_lock:
+        store = _load_store()
+        
+        if store["embeddings"] is None or store["embeddings"].shape[1] != vector.shape[0]:
+            # Start over if the embedding model (and dimension) changed
+            store.update(_empty_store())
+            store["embeddings"] = vector[np.newaxis, :]
+        else:
+            store["embeddings"] = np.vstack([store["embeddings"], vector])
+        store["scopes"].append(scope)
+        store["results"].append(copy.deepcopy(result))
+        store["expires_at"].append(expires_at)
+        
+        # Evict the oldest entries beyond the size limit
+        overflow = len(store["results"]) - SEMANTIC_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            store["embeddings"] = store["embeddings"][overflow:]
+            del store["scopes"][:overflow]
+            del store["results"][:overflow]
+            del store["expires_at"][:overflow]
+        
+        _save_store(store)
+
+
+def _insert_when_complete(question: str, scope: Tuple, result: Dict[str, Any]) -> Iterator[str]:
+    """Pass through a streamed answer, caching the full text once it completes."""
+    chunks = []
+    for chunk in result["answer"]:
+        chunks.append(chunk)
+        yield chunk
+    
+    insert(question, scope, {**result, "answer": "".join(chunks)})
+
+
+def semantic_cached(mode: str) -> Callable:
+    """
+    Decorate an agent function taking a question as its first argument
+    so that semantically similar questions return the cached answer.
+    
+    Streamed answers (iterators of text chunks) are cached once fully consumed.
+    Results flagged "partial" (a source failed while answering) are never cached.
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+        question_param = next(iter(signature.parameters))
+        
+        @wraps(func)
+        def wrapper(question: str, *args, **kwargs) -> Dict[str, Any]:
+            # Normalize the arguments so defaults and keywords share a scope
+            bound = signature.bind(question, *args, **kwargs)
+            bound.apply_defaults()
+            call_kwargs = {k: v for k, v in bound.arguments.items() if k != question_param}
+            
+            scope = make_scope(mode, **call_kwargs)
+            if scope[1] is None:
+                # Without a store version there is no safe scope to cache under
+                return func(question, *args, **kwargs)
+            
+            cached = lookup(question, scope)
+            if cached is not None:
+                return cached
+            
+            result = func(question, *args, **kwargs)
+            if result.get("partial"):
+                return result
+            if isinstance(result.get("answer"), str):
+                insert(question, scope, result)
+            else:
+                result["answer"] = _insert_when_complete(question, scope, dict(result))
+            return result
+        
+        return wrapper
+    
+    return decorator
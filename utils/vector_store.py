@@ -1,113 +1,373 @@
 """Vector store utilities using ChromaDB with Python 3.14 compatibility."""
 
 import os
-from typing import List
+import uuid
+import asyncio
+import sqlite3
+import threading
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from langchain_core.documents import Document
 
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import CHROMA_PERSIST_DIRECTORY, COLLECTION_NAME, TOP_K_RESULTS
+from config import (
+    CHROMA_PERSIST_DIRECTORY,
+    COLLECTION_NAME,
+    TOP_K_RESULTS,
+    INGEST_BATCH_SIZE,
+    METADATA_SCAN_PAGE_SIZE,
+    HNSW_SPACE,
+    HNSW_CONSTRUCTION_EF,
+    HNSW_M,
+    HNSW_SEARCH_EF,
+)
+from utils import metadata_store
 
 
-# Global variable to cache the vector store
+# Global variables to cache the Chroma client and collection
+_client = None
 _vector_store = None
+_vector_store_lock = threading.Lock()
 
-
-def get_embeddings_model():
-    """Lazy import of embeddings to avoid early chromadb import."""
-    from utils.embeddings import get_embeddings_model as _get_embeddings
-    return _get_embeddings()
+# Cached document count, kept in step with adds and recounted after deletes
+_doc_count: Optional[int] = None
 
 
 def get_vector_store():
-    """Get or create the ChromaDB vector store with lazy loading."""
-    global _vector_store
+    """
+    Get or create the ChromaDB collection with lazy loading.
+    
+    The collection has no embedding function; callers always pass
+    embeddings computed through utils.embeddings.
+    """
+    global _client, _vector_store
     
     if _vector_store is not None:
         return _vector_store
     
-    # Ensure the persist directory exists
-    os.makedirs(CHROMA_PERSIST_DIRECTORY, exist_ok=True)
+    with _vector_store_lock:
+        # Another thread may have finished initializing while we waited
+        if _vector_store is not None:
+            return _vector_store
+        
+        # Ensure the persist directory exists
+        os.makedirs(CHROMA_PERSIST_DIRECTORY, exist_ok=True)
+        
+        # Lazy import to avoid early initialization issues
+        import chromadb
+        
+        if _client is None:
+            _enable_wal(os.path.join(CHROMA_PERSIST_DIRECTORY, "chroma.sqlite3"))
+            _client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIRECTORY)
+        
+        vector_store = _client.get_or_create_collection(
+            name=COLLECTION_NAME,
+            embedding_function=None,
+            metadata={
+                "hnsw:space": HNSW_SPACE,
+                "hnsw:construction_ef": HNSW_CONSTRUCTION_EF,
+                "hnsw:M": HNSW_M,
+                "hnsw:search_ef": HNSW_SEARCH_EF
+            }
+        )
+        
+        # Populate the metadata table for stores created before it existed
+        if metadata_store.initialize():
+            _backfill_metadata(vector_store)
+            metadata_store.mark_backfilled()
+        
+        _vector_store = vector_store
     
-    # Lazy import to avoid early initialization issues
-    from langchain_chroma import Chroma
+    return _vector_store
+
+
+def _enable_wal(db_path: str) -> None:
+    """
+    Switch Chroma's SQLite database to write-ahead logging.
     
-    embeddings = get_embeddings_model()
+    Must run before the Chroma client opens the file: switching modes under
+    an open client leaves it reading a stale view of the database. The mode
+    is stored in the file, so it then applies to Chroma's own connections.
+    Per-connection pragmas (synchronous, mmap_size, cache_size) would not
+    carry over and are left to Chroma.
+    """
+    try:
+        connection = sqlite3.connect(db_path)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        # The database may be locked by another process; keep the default
+        pass
+
+
+def _iter_metadata_pages(collection) -> Iterator[Dict[str, Any]]:
+    """Scan a collection's IDs and metadata one fixed-size page at a time."""
+    offset = 0
+    while True:
+        results = collection.get(include=["metadatas"], limit=METADATA_SCAN_PAGE_SIZE, offset=offset)
+        if not results or not results.get("ids"):
+            break
+        yield results
+        offset += METADATA_SCAN_PAGE_SIZE
+
+
+def _backfill_metadata(collection) -> None:
+    """Record the metadata of all documents already in the collection."""
+    for page in _iter_metadata_pages(collection):
+        metadata_store.add_records(zip(page["ids"], page["metadatas"]))
+
+
+def _to_documents(texts: List[Optional[str]], metadatas: List[Optional[Dict[str, Any]]]) -> List[Document]:
+    """Convert Chroma query results into Documents."""
+    return [
+        Document(page_content=text or "", metadata=metadata or {})
+        for text, metadata in zip(texts, metadatas)
+    ]
+
+
+def add_documents(documents: Iterable[Union[Document, Tuple[str, Dict[str, Any]]]]) -> Dict[Optional[str], Exception]:
+    """
+    Add documents to the vector store, consuming them in batches.
+    
+    Accepts Documents or lightweight (text, metadata) pairs. Each batch is
+    embedded up front through the embedding cache and inserted with its
+    vectors, so Chroma does not embed anything itself.
+    
+    Chunks are tracked by their "source" metadata. When a batch fails, every
+    source with chunks in it is marked failed, the chunks it already stored
+    are removed and its remaining chunks are skipped, while the other
+    sources are still added. A partly stored file would otherwise match
+    has_file_hash and never be re-indexed.
+    
+    Returns:
+        The error for each failed source, keyed by source name
+    """
+    from utils.embeddings import embed_texts
+    global _doc_count
     
-    _vector_store = Chroma(
-        collection_name=COLLECTION_NAME,
-        embedding_function=embeddings,
-        persist_directory=CHROMA_PERSIST_DIRECTORY
+    collection = get_vector_store()
+    failures: Dict[Optional[str], Exception] = {}
+    inserted_ids: Dict[Optional[str], List[str]] = {}
+    
+    pairs = (
+        (doc.page_content, doc.metadata) if isinstance(doc, Document) else doc
+        for doc in documents
+    )
+    # Checked lazily, so sources that fail mid-stream are skipped from then on
+    iterator = (
+        (text, metadata) for text, metadata in pairs
+        if (metadata or {}).get("source") not in failures
     )
+    while True:
+        batch = list(islice(iterator, INGEST_BATCH_SIZE))
+        if not batch:
+            break
+        
+        ids = [str(uuid.uuid4()) for _ in batch]
+        texts = [text for text, _ in batch]
+        metadatas = [metadata or None for _, metadata in batch]
+        sources = [(metadata or {}).get("source") for metadata in metadatas]
+        
+        try:
+            collection.add(
+                ids=ids,
+                embeddings=embed_texts(texts),
+                metadatas=metadatas,
+                documents=texts
+            )
+            metadata_store.add_records(zip(ids, metadatas))
+        except Exception as e:
+            # Roll back the failed sources, including this batch in case it was stored
+            rollback_ids = list(ids)
+            for source in set(sources):
+                failures.setdefault(source, e)
+                rollback_ids.extend(inserted_ids.pop(source, []))
+            _delete_ids(collection, rollback_ids)
+            # Recount on next use rather than guess how much was stored
+            _doc_count = None
+            continue
+        
+        metadata_store.bump_version()
+        for doc_id, source in zip(ids, sources):
+            inserted_ids.setdefault(source, []).append(doc_id)
+        
+        if _doc_count is not None:
+            _doc_count += len(batch)
     
-    return _vector_store
+    return failures
+
 
+async def add_documents_async(
+    documents: Iterable[Union[Document, Tuple[str, Dict[str, Any]]]]
+) -> Dict[Optional[str], Exception]:
+    """Add documents from async code without blocking the event loop."""
+    return await asyncio.to_thread(add_documents, documents)
 
-def add_documents(documents: List[Document]) -> None:
-    """Add documents to the vector store."""
+
+def similarity_search(
+    query: str,
+    k: int = TOP_K_RESULTS,
+    where: Optional[Dict[str, Any]] = None
+) -> List[Document]:
+    """
+    Perform similarity search on the vector store.
+    
+    `where` is a Chroma metadata filter, e.g. {"source": {"$eq": "report.pdf"}},
+    applied during the index search rather than to the top-k results afterwards.
+    """
+    from utils.embeddings import embed_query
+    
     vector_store = get_vector_store()
-    vector_store.add_documents(documents)
+    # Embed through the cache so repeated questions skip the API call
+    results = vector_store.query(
+        query_embeddings=[embed_query(query)],
+        n_results=k,
+        where=where,
+        include=["documents", "metadatas"]
+    )
+    return _to_documents(results["documents"][0], results["metadatas"][0])
 
 
-def similarity_search(query: str, k: int = TOP_K_RESULTS) -> List[Document]:
-    """Perform similarity search on the vector store."""
+def similarity_search_batch(
+    queries: List[str],
+    k: int = TOP_K_RESULTS,
+    where: Optional[Dict[str, Any]] = None
+) -> List[List[Document]]:
+    """Perform similarity search for several queries with one embedding call and one query."""
+    from utils.embeddings import embed_texts
+    
+    if not queries:
+        return []
+    
     vector_store = get_vector_store()
-    return vector_store.similarity_search(query, k=k)
+    results = vector_store.query(
+        query_embeddings=embed_texts(queries),
+        n_results=k,
+        where=where,
+        include=["documents", "metadatas"]
+    )
+    
+    return [
+        _to_documents(texts, metadatas)
+        for texts, metadatas in zip(results["documents"], results["metadatas"])
+    ]
+
+
+def warm_up() -> None:
+    """
+    Open the collection and run one query so the HNSW index is loaded
+    into memory before the first user question.
+    
+    The query reuses a stored embedding, so no embedding API call is made.
+    """
+    try:
+        vector_store = get_vector_store()
+        sample = vector_store.get(limit=1, include=["embeddings"])
+        if sample is None or not sample.get("ids"):
+            return
+        
+        vector_store.query(
+            query_embeddings=[sample["embeddings"][0]],
+            n_results=1,
+            include=[]
+        )
+    except Exception:
+        # Warming up is best-effort; the first query will load the index anyway
+        pass
 
 
 def get_document_count() -> int:
     """Get the number of documents in the vector store."""
+    global _doc_count
+    
+    if _doc_count is not None:
+        return _doc_count
+    
     try:
         vector_store = get_vector_store()
-        return vector_store._collection.count()
+        _doc_count = vector_store.count()
+        return _doc_count
     except Exception:
         return 0
 
 
+def get_store_version() -> Optional[str]:
+    """
+    Get a token that changes whenever documents are added, deleted, or cleared.
+    
+    Returns None if the vector store cannot be opened.
+    """
+    try:
+        # Ensures the metadata tables exist
+        get_vector_store()
+        return metadata_store.get_version()
+    except Exception:
+        return None
+
+
+def has_file_hash(file_hash: str) -> bool:
+    """Check whether a file with this content hash is already indexed."""
+    try:
+        vector_store = get_vector_store()
+        results = vector_store.get(
+            where={"file_hash": file_hash},
+            limit=1,
+            include=[]
+        )
+        return bool(results and results.get("ids"))
+    except Exception:
+        return False
+
+
 def get_all_sources() -> List[str]:
     """Get all unique source names from the vector store."""
     try:
-        vector_store = get_vector_store()
-        
-        # Get all documents metadata
-        collection = vector_store._collection
-        results = collection.get(include=["metadatas"])
-        
-        sources = set()
-        if results and results.get("metadatas"):
-            for metadata in results["metadatas"]:
-                if metadata and "source" in metadata:
-                    sources.add(metadata["source"])
-        
-        return list(sources)
+        # Ensures the metadata table exists and has been backfilled
+        get_vector_store()
+        return metadata_store.list_sources()
     except Exception:
         return []
 
 
+def _delete_ids(collection, ids: List[str]) -> None:
+    """Delete documents by ID from the collection and the metadata table."""
+    batch_size = _client.get_max_batch_size()
+    for start in range(0, len(ids), batch_size):
+        collection.delete(ids=ids[start:start + batch_size])
+    metadata_store.remove_ids(ids)
+    metadata_store.bump_version()
+
+
 def delete_documents_by_source(source: str) -> None:
     """Delete all documents with a specific source."""
-    vector_store = get_vector_store()
-    collection = vector_store._collection
+    global _doc_count
     
-    # Get IDs of documents with this source
-    results = collection.get(include=["metadatas"])
+    collection = get_vector_store()
     
-    ids_to_delete = []
-    if results and results.get("ids") and results.get("metadatas"):
-        for doc_id, metadata in zip(results["ids"], results["metadatas"]):
-            if metadata and metadata.get("source") == source:
-                ids_to_delete.append(doc_id)
+    # Look up the IDs in the indexed sidecar instead of scanning the collection
+    ids_to_delete = metadata_store.get_ids_for_source(source)
+    _delete_ids(collection, ids_to_delete)
+    metadata_store.remove_source(source)
     
-    if ids_to_delete:
-        collection.delete(ids=ids_to_delete)
+    # The sidecar may list IDs Chroma no longer has, so recount instead of subtracting
+    _doc_count = None
 
 
 def clear_all_documents() -> None:
     """Clear all documents from the vector store."""
-    vector_store = get_vector_store()
-    collection = vector_store._collection
+    global _vector_store, _doc_count
+    
+    get_vector_store()
+    
+    # Drop the whole collection rather than deleting every ID;
+    # the next get_vector_store() call recreates it empty
+    with _vector_store_lock:
+        _client.delete_collection(COLLECTION_NAME)
+        _vector_store = None
     
-    # Get all IDs and delete them
-    results = collection.get()
-    if results and results.get("ids"):
-        collection.delete(ids=results["ids"])
+    metadata_store.clear()
+    metadata_store.bump_version()
+    _doc_count = 0